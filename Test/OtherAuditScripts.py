@@ -1,73 +1,375 @@
+import os
+import json
+import random
+import hashlib
+import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-def merge_and_list_increased_items(last_year_file, this_year_file, min_unit_cost, min_percent_increase):
+def read_table(path, columns=None):
+    """
+    Load a CSV, Parquet or Arrow IPC (.arrow/.feather) file, reading only `columns` when given.
+    Columnar files keep their dtypes and skip unread columns entirely.
+    """
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    if str(path).endswith(('.arrow', '.feather')):
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, usecols=columns)
+
+INCREASE_COLUMNS = ['itemId', 'description_this', 'unitPrice_last', 'unitPrice_this', 'percent_increase']
+
+def price_increases(last_df, this_df, min_unit_cost, min_percent_increase):
+    """
+    Join two years of prices on itemId after pre-filtering each side, and keep items whose price
+    rose by more than min_percent_increase. Items priced at 0 last year have no percentage and are skipped.
+    """
+    this_df = this_df[this_df['unitPrice'] > min_unit_cost]
+    last_df = last_df[(last_df['unitPrice'] > 0) & last_df['itemId'].isin(this_df['itemId'])]
+    merged = pd.merge(
+        this_df.rename(columns={'description': 'description_this', 'unitPrice': 'unitPrice_this'}),
+        last_df[['itemId', 'unitPrice']].rename(columns={'unitPrice': 'unitPrice_last'}),
+        on='itemId'
+    )
+    last_price = merged['unitPrice_last'].to_numpy(dtype=float)
+    merged['percent_increase'] = (merged['unitPrice_this'].to_numpy(dtype=float) - last_price) / last_price * 100
+    return merged.loc[merged['percent_increase'] > min_percent_increase, INCREASE_COLUMNS]
+
+def price_increase_pipeline(last_year_name, min_unit_cost, min_percent_increase):
+    return [
+        {'$match': {'unitPrice': {'$gt': min_unit_cost}}},
+        {'$project': {'_id': 0, 'itemId': 1, 'description': 1, 'unitPrice': 1}},
+        {'$lookup': {
+            'from': last_year_name,
+            'localField': 'itemId',
+            'foreignField': 'itemId',
+            'pipeline': [{'$match': {'unitPrice': {'$gt': 0}}}, {'$project': {'_id': 0, 'unitPrice': 1}}],
+            'as': 'last',
+        }},
+        {'$unwind': '$last'},
+        {'$addFields': {'percent_increase': {'$multiply': [
+            {'$divide': [{'$subtract': ['$unitPrice', '$last.unitPrice']}, '$last.unitPrice']}, 100
+        ]}}},
+        {'$match': {'percent_increase': {'$gt': min_percent_increase}}},
+        {'$project': {
+            'itemId': 1, 'description_this': '$description', 'unitPrice_last': '$last.unitPrice',
+            'unitPrice_this': '$unitPrice', 'percent_increase': 1,
+        }},
+    ]
+
+def merge_and_list_increased_items(last_year_file, this_year_file, min_unit_cost, min_percent_increase,
+                                   create_index=False):
     """
     Merge last year's and this year's inventory files, list items with unit cost > min_unit_cost
     and increased by more than min_percent_increase.
+    Both arguments may also be MongoDB collections: in the same database the join runs server-side
+    as a $lookup on itemId, otherwise the projected prices are hash-joined locally.
+
+    The $lookup needs an index on last year's itemId, or it scans that collection once per row of
+    this year's. Create one beforehand, or pass create_index=True to build it here (a write that
+    needs createIndex privileges and can take a while on a large collection).
     """
-    last_df = pd.read_csv(last_year_file)
-    this_df = pd.read_csv(this_year_file)
-    merged = pd.merge(this_df, last_df, on='itemId', suffixes=('_this', '_last'))
-    merged['unit_cost_increase'] = merged['unitPrice_this'] - merged['unitPrice_last']
-    merged['percent_increase'] = (merged['unit_cost_increase'] / merged['unitPrice_last']) * 100
-    result = merged[
-        (merged['unitPrice_this'] > min_unit_cost) &
-        (merged['percent_increase'] > min_percent_increase)
-    ]
-    return result[['itemId', 'description_this', 'unitPrice_last', 'unitPrice_this', 'percent_increase']]
+    if hasattr(last_year_file, 'aggregate') and hasattr(this_year_file, 'aggregate'):
+        if last_year_file.database.name == this_year_file.database.name:
+            if create_index:
+                last_year_file.create_index('itemId')
+            rows = this_year_file.aggregate(
+                price_increase_pipeline(last_year_file.name, min_unit_cost, min_percent_increase), allowDiskUse=True
+            )
+            return pd.DataFrame(list(rows), columns=INCREASE_COLUMNS)
+        this_df = pd.DataFrame(list(this_year_file.find(
+            {'unitPrice': {'$gt': min_unit_cost}}, {'_id': 0, 'itemId': 1, 'description': 1, 'unitPrice': 1}
+        )), columns=['itemId', 'description', 'unitPrice'])
+        last_df = pd.DataFrame(list(last_year_file.find(
+            {'unitPrice': {'$gt': 0}}, {'_id': 0, 'itemId': 1, 'unitPrice': 1}
+        )), columns=['itemId', 'unitPrice'])
+        return price_increases(last_df, this_df, min_unit_cost, min_percent_increase)
+
+    last_df = read_table(last_year_file, ['itemId', 'unitPrice'])
+    this_df = read_table(this_year_file, ['itemId', 'description', 'unitPrice'])
+    return price_increases(last_df, this_df, min_unit_cost, min_percent_increase)
+
+SALES_CHUNK_SIZE = 500_000
+
+def iter_frames(path, columns, chunksize=SALES_CHUNK_SIZE):
+    """
+    Yield a CSV or Parquet file as DataFrame chunks of at most chunksize rows.
+    """
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif str(path).endswith(('.arrow', '.feather')):
+        yield read_table(path, columns)
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+def combine_sales(frames):
+    return pd.concat(frames).groupby(level=0).agg({'quantity_sold': 'sum', 'sale_date': 'max'})
+
+# --- Persistent sales store: per-item, per-day rollups in a SQLite file, appended one sales file at a time.
+
+SALES_STORE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# The sales period is whole calendar days with both ends included: [start day 00:00, day after end 00:00)
+def period_bounds(sales_period_start, sales_period_end):
+    start = pd.to_datetime(sales_period_start).normalize()
+    return start, pd.to_datetime(sales_period_end).normalize() + pd.Timedelta(days=1)
+
+def open_sales_store(store_path, create=False):
+    # sqlite3.connect would silently create an empty store for a mistyped path
+    if not create and not os.path.exists(store_path):
+        raise FileNotFoundError(f"Sales store {store_path} does not exist; build it with ingest_sales")
+    conn = sqlite3.connect(store_path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            itemId NOT NULL,
+            day TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            PRIMARY KEY (itemId, day)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS sales_files (
+            sha256 TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            ingested_at TEXT NOT NULL
+        );
+    """)
+    return conn
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ingest_sales(sales_file, store_path, chunksize=SALES_CHUNK_SIZE):
+    """
+    Add a sales file (CSV/Parquet/Arrow) to the store's daily rollups, in one transaction.
+    Files already ingested (same contents) are skipped. Returns the number of sales rows added.
+    """
+    checksum = file_sha256(sales_file)
+    conn = open_sales_store(store_path, create=True)
+    try:
+        if conn.execute("SELECT 1 FROM sales_files WHERE sha256 = ?", (checksum,)).fetchone():
+            print(f"{sales_file} is already in {store_path}; skipping")
+            return 0
+        rows = 0
+        with conn:
+            for chunk in iter_frames(sales_file, ['itemId', 'sale_date', 'quantity'], chunksize):
+                chunk['day'] = pd.to_datetime(chunk['sale_date']).dt.strftime('%Y-%m-%d')
+                daily = chunk.groupby(['itemId', 'day'], as_index=False)['quantity'].sum()
+                conn.executemany(
+                    "INSERT INTO sales_daily (itemId, day, quantity) VALUES (?, ?, ?) "
+                    "ON CONFLICT (itemId, day) DO UPDATE SET quantity = quantity + excluded.quantity",
+                    daily.astype(object).itertuples(index=False, name=None)
+                )
+                rows += len(chunk)
+            conn.execute(
+                "INSERT INTO sales_files (sha256, path, rows, ingested_at) VALUES (?, ?, ?, ?)",
+                (checksum, str(sales_file), rows, datetime.now().isoformat(timespec='seconds'))
+            )
+        print(f"Ingested {rows} sales rows from {sales_file} into {store_path}")
+        return rows
+    finally:
+        conn.close()
+
+def summarize_sales_store(store_path, sales_period_start, sales_period_end):
+    """
+    Period quantity and last sale date per itemId, answered from the daily rollups alone.
+    """
+    start, end = (bound.strftime('%Y-%m-%d') for bound in period_bounds(sales_period_start, sales_period_end))
+    conn = open_sales_store(store_path)
+    try:
+        summary = pd.read_sql_query(
+            "SELECT itemId, SUM(CASE WHEN day >= ? AND day < ? THEN quantity ELSE 0 END) AS quantity_sold, "
+            "MAX(day) AS sale_date FROM sales_daily GROUP BY itemId",
+            conn, params=(start, end), index_col='itemId'
+        )
+    finally:
+        conn.close()
+    summary['sale_date'] = pd.to_datetime(summary['sale_date'])
+    return summary
+
+def summarize_sales(sales_source, sales_period_start, sales_period_end, chunksize=SALES_CHUNK_SIZE):
+    """
+    One pass over the sales history computing, per itemId, the quantity sold within the period
+    and the last sale date. Memory is bounded by the number of distinct items, not sales rows.
+    sales_source may be a sales file, a sales collection or a sales store built by ingest_sales.
+    """
+    if str(sales_source).endswith(SALES_STORE_EXTENSIONS):
+        return summarize_sales_store(sales_source, sales_period_start, sales_period_end)
+    start, end = period_bounds(sales_period_start, sales_period_end)
+    if hasattr(sales_source, 'aggregate'):
+        sale_date = {'$toDate': '$sale_date'}
+        rows = sales_source.aggregate([
+            {'$group': {
+                '_id': '$itemId',
+                'quantity_sold': {'$sum': {'$cond': [
+                    {'$and': [{'$gte': [sale_date, start.to_pydatetime()]}, {'$lt': [sale_date, end.to_pydatetime()]}]},
+                    '$quantity', 0
+                ]}},
+                'sale_date': {'$max': sale_date},
+            }},
+        ], allowDiskUse=True)
+        summary = pd.DataFrame(list(rows), columns=['_id', 'quantity_sold', 'sale_date']).set_index('_id')
+        summary.index.name = 'itemId'
+        return summary
+
+    summary = None
+    for chunk in iter_frames(sales_source, ['itemId', 'sale_date', 'quantity'], chunksize):
+        chunk['sale_date'] = pd.to_datetime(chunk['sale_date'])
+        in_period = (chunk['sale_date'] >= start) & (chunk['sale_date'] < end)
+        chunk['quantity_sold'] = chunk['quantity'].where(in_period, 0)
+        part = chunk.groupby('itemId').agg({'quantity_sold': 'sum', 'sale_date': 'max'})
+        summary = part if summary is None else combine_sales([summary, part])
+    if summary is None:
+        return pd.DataFrame({'quantity_sold': [], 'sale_date': pd.to_datetime([])}, index=pd.Index([], name='itemId'))
+    return summary
 
 def list_excess_inventory_and_obsolete(inventory_file, sales_file, sales_period_start, sales_period_end, obsolete_date):
     """
     List inventory quantities on hand in excess of units sold during a period.
     List items with last sales date prior to obsolete_date.
+    Either input may be a file (CSV/Parquet/Arrow) or a MongoDB collection; sales may also be
+    a sales store (.db/.sqlite) kept current with ingest_sales.
     """
-    inv_df = pd.read_csv(inventory_file)
-    sales_df = pd.read_csv(sales_file)
-    sales_df['sale_date'] = pd.to_datetime(sales_df['sale_date'])
-    period_sales = sales_df[
-        (sales_df['sale_date'] >= pd.to_datetime(sales_period_start)) &
-        (sales_df['sale_date'] <= pd.to_datetime(sales_period_end))
-    ]
-    sales_qty = period_sales.groupby('itemId')['quantity'].sum().reset_index()
-    merged = pd.merge(inv_df, sales_qty, on='itemId', how='left', suffixes=('_inv', '_sold'))
-    merged['quantity_sold'] = merged['quantity'].fillna(0)
+    if hasattr(inventory_file, 'aggregate'):
+        inv_df = pd.DataFrame(list(inventory_file.find({}, {'_id': 0, 'itemId': 1, 'description': 1, 'quantity': 1})),
+                              columns=['itemId', 'description', 'quantity'])
+    else:
+        inv_df = read_table(inventory_file, ['itemId', 'description', 'quantity'])
+    sales = summarize_sales(sales_file, sales_period_start, sales_period_end)
+    merged = inv_df.rename(columns={'quantity': 'quantity_inv'}).merge(sales, left_on='itemId', right_index=True, how='left')
+    merged['quantity_sold'] = merged['quantity_sold'].fillna(0)
     excess = merged[merged['quantity_inv'] > merged['quantity_sold']]
-    # Obsolete items
-    last_sales = sales_df.groupby('itemId')['sale_date'].max().reset_index()
-    merged2 = pd.merge(inv_df, last_sales, on='itemId', how='left')
-    obsolete = merged2[merged2['sale_date'] < pd.to_datetime(obsolete_date)]
+    # Items never sold have no sale_date and are not reported as obsolete
+    obsolete = merged[merged['sale_date'] < pd.to_datetime(obsolete_date)]
     return excess[['itemId', 'description', 'quantity_inv', 'quantity_sold']], obsolete[['itemId', 'description', 'sale_date']]
 
-def sample_inventory_tags(inventory_file, sample_size):
+TAG_SAMPLING_METHODS = ('random', 'systematic')
+# One JSON record per draw is appended, so earlier selections are kept as audit evidence
+TAG_SELECTION_FILE = 'tag_selections.jsonl'
+
+def sample_positions(population, sample_size, method='random', seed=None):
+    """
+    Sorted 0-based positions to draw from a population in tag order: a seeded simple random
+    sample, or every k-th position from a random start for systematic sampling.
+    """
+    rng = random.Random(seed)
+    sample_size = min(sample_size, population)
+    if sample_size <= 0:
+        return []
+    if method == 'systematic':
+        interval = population / sample_size
+        start = rng.random() * interval
+        return [int(start + i * interval) for i in range(sample_size)]
+    if method != 'random':
+        raise ValueError(f"Unknown tag sampling method '{method}' (use one of {', '.join(TAG_SAMPLING_METHODS)})")
+    return sorted(rng.sample(range(population), sample_size))
+
+def sample_inventory_tags(inventory_file, sample_size, method='random', seed=None,
+                          selection_file=TAG_SELECTION_FILE, field='tag_number', create_index=False):
     """
     Select a sample of inventory tag numbers and print the sample selection.
+    Tags are drawn in sorted order, so a seed reproduces the same selection from a file or a
+    collection holding the same tags. An unseeded random draw on a collection is pushed down
+    to $sample. Each selection and its parameters are appended to selection_file (None to skip).
+
+    A seeded or systematic draw on a collection numbers every numeric tag in sorted order on the
+    server and returns only the chosen positions. That is one round-trip, but the server still
+    reads the whole tag column: pass create_index=True to add an index on field so it walks the
+    index instead of sorting the documents.
     """
-    df = pd.read_csv(inventory_file)
-    sample = df.sample(n=sample_size)
-    return sample['tag_number'].tolist()
+    if seed is None and not (method == 'random' and hasattr(inventory_file, 'aggregate')):
+        seed = random.SystemRandom().randrange(2 ** 32)
+
+    if hasattr(inventory_file, 'aggregate'):
+        source = inventory_file.full_name
+        # A numeric range (rather than $exists) can be answered from an index on field
+        query = {field: {'$gte': float('-inf')}}
+        population = inventory_file.count_documents(query)
+        if seed is None:
+            pipeline = [{'$match': query}, {'$sample': {'size': sample_size}}]
+        else:
+            if create_index:
+                inventory_file.create_index(field)
+            positions = [p + 1 for p in sample_positions(population, sample_size, method, seed)]
+            pipeline = [
+                {'$match': query},
+                {'$setWindowFields': {'sortBy': {field: 1}, 'output': {'position': {'$documentNumber': {}}}}},
+                {'$match': {'position': {'$in': positions}}},
+            ]
+        cursor = inventory_file.aggregate(pipeline + [{'$project': {'_id': 0, field: 1}}], allowDiskUse=True)
+        tags = sorted(doc[field] for doc in cursor)
+    else:
+        source = str(inventory_file)
+        all_tags = np.sort(read_table(inventory_file, [field])[field].dropna().to_numpy())
+        population = len(all_tags)
+        tags = all_tags[sample_positions(population, sample_size, method, seed)].tolist()
+
+    if selection_file:
+        record = {
+            'source': source,
+            'field': field,
+            'method': method,
+            'seed': seed,
+            'sampleSize': sample_size,
+            'population': population,
+            'drawnAt': datetime.now().isoformat(timespec='seconds'),
+            'tags': tags,
+        }
+        with open(selection_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+    print(f"Selected {len(tags)} of {population} tags ({method}, seed={seed})")
+    return tags
 
-def scan_tag_sequence(inventory_file):
+def tag_runs_from_counts(tag_counts):
     """
-    Scan the sequence of inventory tag numbers and print any missing or duplicate numbers.
+    Walk (tag, count) pairs in ascending tag order once, returning missing tags as
+    inclusive (first, last) ranges and the tags that occur more than once.
     """
-    df = pd.read_csv(inventory_file)
-    tags = df['tag_number'].sort_values().tolist()
     missing = []
     duplicates = []
-    seen = set()
-    for i in range(tags[0], tags[-1] + 1):
-        if i not in tags:
-            missing.append(i)
-    for tag in tags:
-        if tag in seen:
+    previous = None
+    for tag, count in tag_counts:
+        if previous is not None and tag > previous + 1:
+            missing.append((previous + 1, tag - 1))
+        if count > 1:
             duplicates.append(tag)
-        else:
-            seen.add(tag)
+        previous = tag
+    return missing, duplicates
+
+def scan_tag_sequence(source, field='tag_number'):
+    """
+    Scan the sequence of inventory tag numbers for gaps and duplicates.
+    source is an inventory file or a MongoDB collection; on a collection the tags are
+    grouped and sorted server-side. Missing tags are returned as (first, last) ranges.
+    """
+    if hasattr(source, 'aggregate'):
+        cursor = source.aggregate([
+            {'$match': {field: {'$type': 'number'}}},
+            {'$group': {'_id': {'$toLong': f'${field}'}, 'count': {'$sum': 1}}},
+            {'$sort': {'_id': 1}},
+        ], allowDiskUse=True)
+        return tag_runs_from_counts((doc['_id'], doc['count']) for doc in cursor)
+
+    df = read_table(source, [field])
+    tags = np.sort(df[field].dropna().to_numpy(dtype=np.int64))
+    if len(tags) == 0:
+        return [], []
+    repeated = tags[1:][np.diff(tags) == 0]
+    duplicates = np.unique(repeated).tolist()
+    unique = np.unique(tags)
+    gaps = np.nonzero(np.diff(unique) > 1)[0]
+    missing = list(zip((unique[gaps] + 1).tolist(), (unique[gaps + 1] - 1).tolist()))
     return missing, duplicates
 
-# Functions available:
+# Functions available (inputs may be CSV, Parquet or Arrow IPC files):
 # - merge_and_list_increased_items
 # - list_excess_inventory_and_obsolete
+# - ingest_sales (append a sales file to a persistent .db rollup store)
 # - sample_inventory_tags
 # - scan_tag_sequence
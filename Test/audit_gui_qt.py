@@ -1,19 +1,17 @@
 import sys
+import threading
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
     QLineEdit, QPushButton, QTableWidget, QTableWidgetItem, QMessageBox, QProgressBar,
     QDialog, QListWidget, QListWidgetItem, QCheckBox, QDialogButtonBox
 )
 from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
 from Test.PriceTestAuditScript import (
-    perform_price_testing_audit,
     export_audit_results,
-    find_low_stock_items,
-    find_high_unit_price_items,
     get_collection_names,
-    audit_all_collections,
-    db
+    audit_collection,
+    run_collection_audits
 )
 from Test.OtherAuditScripts import (
     merge_and_list_increased_items,
@@ -56,12 +54,43 @@ class CollectionSelectorDialog(QDialog):
             return [self.list_widget.item(i).text() for i in range(self.list_widget.count())]
         return [item.text() for item in self.list_widget.selectedItems()]
 
+class AuditWorker(QThread):
+    """Runs the collection audits off the UI thread and reports back through signals"""
+    progress_changed = pyqtSignal(int)
+    collection_done = pyqtSignal(str, object, object)
+    completed = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, collection_names, audit_fn, parent=None):
+        super().__init__(parent)
+        self.collection_names = list(collection_names)
+        self.audit_fn = audit_fn
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            run = run_collection_audits(
+                self.collection_names,
+                self.audit_fn,
+                on_result=self.collection_done.emit,
+                on_progress=lambda fraction: self.progress_changed.emit(int(fraction * 100)),
+                cancel_event=self.cancel_event
+            )
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.completed.emit(run)
+
+    def cancel(self):
+        self.cancel_event.set()
+
 class AuditApp(QWidget):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Inventory Dashboard")
         self.setMinimumSize(1000, 600)
         self.selected_collections = get_collection_names()  # Default: all
+        self.worker = None
         self.init_ui()
 
     def init_ui(self):
@@ -93,6 +122,11 @@ class AuditApp(QWidget):
         self.run_btn.clicked.connect(self.run_audit)
         controls.addWidget(self.run_btn)
 
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_audit)
+        controls.addWidget(self.cancel_btn)
+
         self.settings_btn = QPushButton("Settings")
         self.settings_btn.clicked.connect(self.open_settings)
         controls.addWidget(self.settings_btn)
@@ -137,50 +171,77 @@ class AuditApp(QWidget):
             audit_type = self.audit_type.currentText()
             sample_size = int(self.sample_size.text())
             threshold_value = float(self.threshold.text())
-            self.progress.setValue(0)
-            collection_names = self.selected_collections
-            all_results = {}
-            total = len(collection_names)
-            for idx, col_name in enumerate(collection_names, 1):
-                self.progress.setValue(int(idx / total * 100))
-                collection = db[col_name]
-                if audit_type == "Price Testing":
-                    items = perform_price_testing_audit(collection, sample_size, threshold_value)
-                elif audit_type == "Low Stock":
-                    items = find_low_stock_items(collection, stock_threshold=int(self.threshold.text()))
-                elif audit_type == "High Unit Price":
-                    items = find_high_unit_price_items(collection, unit_price_threshold=threshold_value)
-                elif audit_type == "Merge and List":
-                    items = merge_and_list_increased_items(collection, sample_size, threshold_value)
-                elif audit_type == "Excess items":
-                    items = list_excess_inventory_and_obsolete(collection, sample_size, threshold_value)
-                elif audit_type == "Scan tags":
-                    items = scan_tag_sequence(collection)
-                else:
-                    items = []
-                all_results[col_name] = items
-            self.progress.setValue(100)
-            # Combine all results for display
-            combined = []
-            for col, items in all_results.items():
-                for item in items:
-                    item['Collection'] = col
-                    combined.append(item)
-            if combined:
-                df = export_audit_results(combined, filename=None)
-                self.status.setText(f"Audited {len(combined)} items across {len(collection_names)} collections.")
-                self.populate_table(df)
-            else:
-                self.status.setText("No items found for audit.")
-                self.table.setRowCount(0)
-        except Exception as e:
+        except ValueError as e:
             QMessageBox.critical(self, "Error", str(e))
-            self.status.setText("Error running audit.")
-            self.progress.setValue(0)
+            return
+
+        def audit_fn(collection, progress):
+            if audit_type in ("Price Testing", "Low Stock", "High Unit Price"):
+                return audit_collection(collection, audit_type, sample_size, threshold_value, progress)
+            elif audit_type == "Merge and List":
+                return merge_and_list_increased_items(collection, sample_size, threshold_value)
+            elif audit_type == "Excess items":
+                return list_excess_inventory_and_obsolete(collection, sample_size, threshold_value)
+            elif audit_type == "Scan tags":
+                return scan_tag_sequence(collection)
+            return []
+
+        self.table.setRowCount(0)
+        self.progress.setValue(0)
+        self.status.setText(f"Auditing {len(self.selected_collections)} collections...")
+        self.run_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.worker = AuditWorker(self.selected_collections, audit_fn, self)
+        self.worker.progress_changed.connect(self.progress.setValue)
+        self.worker.collection_done.connect(self.on_collection_done)
+        self.worker.completed.connect(self.on_audit_completed)
+        self.worker.failed.connect(self.on_audit_failed)
+        self.worker.start()
+
+    def cancel_audit(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.status.setText("Cancelling audit...")
+
+    def on_collection_done(self, name, items, error):
+        # Stream each collection's rows into the table as soon as it finishes
+        if error is None and items:
+            rows = [item for item in items if isinstance(item, dict)]
+            if rows:
+                self.append_rows(export_audit_results(rows, filename=None))
+        self.status.setText(f"{name}: {'failed (' + error + ')' if error else 'done'}")
+
+    def on_audit_completed(self, run):
+        self.run_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        failed = {name: error for name, error in run['errors'].items() if error != "cancelled"}
+        if run['cancelled']:
+            self.status.setText(f"Audit cancelled after {len(run['results'])} of {len(self.selected_collections)} collections.")
+        elif run['items']:
+            self.progress.setValue(100)
+            self.status.setText(
+                f"Audited {len(run['items'])} items across {len(run['results'])} collections."
+                + (f" Failed: {', '.join(failed)}" if failed else "")
+            )
+        else:
+            self.progress.setValue(100)
+            self.status.setText("No items found for audit." + (f" Failed: {', '.join(failed)}" if failed else ""))
+
+    def on_audit_failed(self, message):
+        self.run_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        QMessageBox.critical(self, "Error", message)
+        self.status.setText("Error running audit.")
+        self.progress.setValue(0)
 
     def populate_table(self, df):
         self.table.setRowCount(0)
-        for row_idx, item in enumerate(df.to_dict(orient='records')):
+        self.append_rows(df)
+
+    def append_rows(self, df):
+        for item in df.to_dict(orient='records'):
+            row_idx = self.table.rowCount()
             self.table.insertRow(row_idx)
             for col_idx, key in enumerate([
                 'Item ID', 'Description', 'Unit Price', 'Quantity', 'Extended Value',
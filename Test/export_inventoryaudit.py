@@ -1,9 +1,18 @@
 import os
+import io
+import gzip
 import json
-from datetime import datetime
+import math
+import hashlib
+import argparse
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
 from pymongo import MongoClient
 from pymongo.errors import ServerSelectionTimeoutError
-from bson import json_util
+from bson import json_util, ObjectId, Decimal128
 
 # Reuse the MongoDB connection string from a.py
 try:
@@ -27,12 +36,373 @@ def ensure_dir(path: str) -> None:
         os.makedirs(path, exist_ok=True)
 
 
-def export_collections_to_json(db_name: str = DB_NAME, output_dir: str | None = None, pretty: bool = True) -> list[str]:
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+MANIFEST_FILE = "manifest.json"
+CHECKPOINT_FILE = "checkpoint.json"
+# How far before the previous maxId a delta re-reads, to catch ObjectIds from skewed or slow clients
+DELTA_OVERLAP_SECONDS = 300
+COLUMNAR_FORMATS = ("parquet", "arrow")
+# Documents drawn with $sample to infer the Arrow types of nested object and array fields
+SCHEMA_SAMPLE_SIZE = 1000
+
+
+def open_output(path: str, compression: str | None = None):
+    """
+    Open a text stream for writing, optionally gzip- or zstd-compressed.
+    """
+    if compression is None:
+        return open(path, "w", encoding="utf-8")
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as import_error:
+            raise RuntimeError("zstd compression requires the zstandard package (pip install zstandard).") from import_error
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, "wb")), encoding="utf-8")
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def write_documents(documents: Iterable[dict], f, fmt: str = "json", pretty: bool = True) -> int:
+    """
+    Write documents one at a time as NDJSON or as a JSON array, returning the count written.
+
+    The JSON array output is byte-for-byte what json.dump(list, indent=2) would produce.
+    """
+    count = 0
+    if fmt == "ndjson":
+        for doc in documents:
+            f.write(json.dumps(doc, default=json_util.default, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+        return count
+    if fmt != "json":
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    separator = ",\n  " if pretty else ", "
+    for doc in documents:
+        if pretty:
+            text = json.dumps(doc, default=json_util.default, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        else:
+            text = json.dumps(doc, default=json_util.default, ensure_ascii=False)
+        f.write(("[\n  " if pretty else "[") if count == 0 else separator)
+        f.write(text)
+        count += 1
+    f.write(("\n]" if pretty else "]") if count else "[]")
+    return count
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def id_type_bracket(value) -> str:
+    # MongoDB compares all numeric types with each other but never across other BSON types
+    if isinstance(value, (int, float, Decimal128)) and not isinstance(value, bool):
+        return "number"
+    return type(value).__name__
+
+
+def single_id_type(collection) -> bool:
+    """
+    True when every _id has one BSON type. _ids sort by type first, so comparing the
+    smallest and largest is enough.
+    """
+    first = collection.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if first is None:
+        return True
+    return id_type_bracket(first["_id"]) == id_type_bracket(last["_id"])
+
+
+def partition_filters(collection, parts: int) -> list[dict]:
+    """
+    Split a collection into up to `parts` _id ranges, using split points from a server-side $sample.
+
+    Range bounds only match _ids of their own BSON type, so a collection with mixed _id types
+    is exported as a single part rather than silently losing documents.
+    """
+    if parts <= 1 or not single_id_type(collection):
+        return [{}]
+    sample = [d["_id"] for d in collection.aggregate([
+        {"$sample": {"size": parts * 20}},
+        {"$project": {"_id": 1}},
+        {"$sort": {"_id": 1}},
+    ])]
+    bounds = []
+    for i in range(1, parts):
+        point = sample[int(len(sample) * i / parts)] if sample else None
+        if point is not None and point not in bounds:
+            bounds.append(point)
+    edges = [None] + bounds + [None]
+    filters = []
+    for lower, upper in zip(edges, edges[1:]):
+        condition = {}
+        if lower is not None:
+            condition["$gte"] = lower
+        if upper is not None:
+            condition["$lt"] = upper
+        filters.append({"_id": condition} if condition else {})
+    return filters
+
+
+def require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as import_error:
+        raise RuntimeError("Parquet/Arrow export requires the pyarrow package (pip install pyarrow).") from import_error
+    return pyarrow
+
+
+def columnar_value(value):
+    """
+    Convert BSON-only values into types Arrow can store (ObjectId -> str, Decimal128 -> float).
+    """
+    if isinstance(value, dict):
+        return {k: columnar_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [columnar_value(v) for v in value]
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+NUMERIC_BSON_TYPES = {"double", "decimal", "int", "long"}
+
+
+def field_types(collection) -> dict[str, set[str]]:
+    """
+    Every top-level field in the collection with the set of non-null BSON types it holds.
+    """
+    census = collection.aggregate([
+        {"$project": {"fields": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$fields"},
+        {"$group": {"_id": "$fields.k", "types": {"$addToSet": {"$type": "$fields.v"}}}},
+    ], allowDiskUse=True)
+    return {row["_id"]: set(row["types"]) - {"null"} for row in census}
+
+
+def infer_schema(collection):
+    """
+    Infer one Arrow schema for a whole collection.
+
+    Columns come from a server-side census of every top-level field, so no field is dropped;
+    int/long/double/decimal mixes widen to double. Nested objects and arrays take their type
+    from a $sample. A field whose types cannot share one column raises ValueError.
     """
-    Export all collections from the specified database to JSON files.
+    pa = require_pyarrow()
+    scalar_types = {
+        "double": pa.float64(), "decimal": pa.float64(), "int": pa.int64(), "long": pa.int64(),
+        "string": pa.string(), "objectId": pa.string(), "bool": pa.bool_(), "date": pa.timestamp("ms"),
+    }
+    sample = [columnar_value(d) for d in collection.aggregate([{"$sample": {"size": SCHEMA_SAMPLE_SIZE}}])]
+    sampled = pa.Table.from_pylist(sample).schema if sample else pa.schema([])
+    fields = []
+    for name, types in field_types(collection).items():
+        kind = next(iter(types)) if len(types) == 1 else None
+        if not types:
+            arrow_type = pa.null()
+        elif types <= NUMERIC_BSON_TYPES:
+            arrow_type = pa.int64() if types <= {"int", "long"} else pa.float64()
+        elif kind in scalar_types:
+            arrow_type = scalar_types[kind]
+        elif kind in ("object", "array") and name in sampled.names:
+            arrow_type = sampled.field(name).type
+        else:
+            raise ValueError(
+                f"{collection.name}.{name} holds {', '.join(sorted(types))} values that cannot be typed as one "
+                f"Arrow column; export this collection as json or ndjson"
+            )
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def serialize_schema(schema) -> bytes:
+    return schema.serialize().to_pybytes()
+
+
+def deserialize_schema(data: bytes):
+    pa = require_pyarrow()
+    return pa.ipc.read_schema(pa.py_buffer(data))
+
+
+def write_columnar(documents: Iterable[dict], file_path: str, fmt: str, schema, batch_size: int, compression: str | None) -> int:
+    """
+    Write documents as Parquet or Arrow IPC record batches of batch_size rows, returning the count written.
+
+    Absent values are written as nulls. A document with a field outside the schema, or a value
+    that does not fit its column, raises ValueError instead of being dropped or truncated.
+    """
+    pa = require_pyarrow()
+    if fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(file_path, schema, compression=compression or "snappy")
+    elif fmt == "arrow":
+        writer = pa.ipc.new_file(file_path, schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    names = set(schema.names)
+    count = 0
+    documents = iter(documents)
+    with writer:
+        while rows := [columnar_value(doc) for doc in islice(documents, batch_size)]:
+            for row in rows:
+                extra = row.keys() - names
+                if extra:
+                    raise ValueError(f"{file_path}: document {row.get('_id')} has fields {sorted(extra)} outside the planned schema")
+            try:
+                batch = pa.RecordBatch.from_pylist(rows, schema=schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as exc:
+                raise ValueError(f"{file_path}: documents do not fit the planned schema: {exc}") from exc
+            writer.write_batch(batch)
+            count += len(rows)
+    return count
+
+
+def export_part(collection, query: dict, file_path: str, fmt: str, pretty: bool, batch_size: int,
+                compression: str | None, schema=None) -> dict:
+    cursor = collection.find(query, batch_size=batch_size)
+    if fmt in COLUMNAR_FORMATS:
+        count = write_columnar(cursor, file_path, fmt, schema, batch_size, compression)
+    else:
+        with open_output(file_path, compression) as f:
+            count = write_documents(cursor, f, fmt, pretty)
+    return {
+        "file": os.path.basename(file_path),
+        "filter": query,
+        "count": count,
+        "sha256": file_sha256(file_path),
+    }
+
+
+def read_state(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json_util.loads(f.read())
+
+
+def write_state(path: str, data: dict) -> None:
+    # Write-then-rename so an interrupted run never leaves a truncated checkpoint or manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, default=json_util.default, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def and_filters(filters: list[dict]) -> dict:
+    filters = [f for f in filters if f]
+    if not filters:
+        return {}
+    return filters[0] if len(filters) == 1 else {"$and": filters}
+
+
+def overlap_start(max_id: ObjectId) -> ObjectId:
+    return ObjectId.from_datetime(max_id.generation_time - timedelta(seconds=DELTA_OVERLAP_SECONDS))
+
+
+def delta_filter(previous: dict | None, collection_name: str, updated_field: str | None) -> dict:
+    """
+    Select documents inserted since the previous export or, when updated_field is given,
+    modified since it started.
+
+    ObjectIds come from client clocks, so an insert made after the previous export can still
+    sort below its maxId. For ObjectId _ids the delta therefore re-reads DELTA_OVERLAP_SECONDS
+    before the previous maxId, so documents in that window can appear in two consecutive
+    deltas; load delta parts as upserts keyed on _id. Only the bounded marker (maxId and the
+    manifest's startedAt) is stored, never a list of _ids, so the query stays small however
+    many documents fall in the window. Inserts whose ObjectId is older than the window, and
+    any _id type that is not an ObjectId (compared with a plain $gt), are only caught
+    reliably with updated_field.
+    """
+    if previous is None or collection_name not in previous["collections"]:
+        return {}
+    conditions = []
+    entry = previous["collections"][collection_name]
+    max_id = entry.get("maxId")
+    if isinstance(max_id, ObjectId):
+        conditions.append({"_id": {"$gte": overlap_start(max_id)}})
+    elif max_id is not None:
+        conditions.append({"_id": {"$gt": max_id}})
+    if updated_field:
+        conditions.append({updated_field: {"$gte": previous["startedAt"]}})
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+
+def plan_export(db, db_name: str, base_output_dir: str, fmt: str, extension: str, partition_size: int,
+                previous: dict | None, updated_field: str | None) -> tuple[list[dict], dict, dict]:
+    tasks = []
+    marks = {}
+    schemas = {}
+    for collection_name in db.list_collection_names():
+        collection = db[collection_name]
+        last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        max_id = last["_id"] if last else None
+        marks[collection_name] = {"maxId": max_id}
+        if fmt in COLUMNAR_FORMATS:
+            # One schema per collection, stored in the checkpoint, so every part file matches
+            schemas[collection_name] = serialize_schema(infer_schema(collection))
+        scope = [delta_filter(previous, collection_name, updated_field)]
+        # Cap at the current high-water mark so inserts made during the export land in the next delta.
+        # The cap would drop _ids of other BSON types, so it is skipped when types are mixed.
+        if last and single_id_type(collection):
+            scope.append({"_id": {"$lte": max_id}})
+        parts = 1
+        if previous is None and partition_size:
+            parts = max(1, math.ceil(collection.estimated_document_count() / partition_size))
+        filters = partition_filters(collection, parts)
+        for i, part_filter in enumerate(filters):
+            suffix = f".part{i:03d}" if len(filters) > 1 else ""
+            tasks.append({
+                "collection": collection_name,
+                "filter": and_filters(scope + [part_filter]),
+                "path": os.path.join(base_output_dir, f"{db_name}_{collection_name}{suffix}{extension}"),
+            })
+    return tasks, marks, schemas
+
+
+def export_collections_to_json(
+    db_name: str = DB_NAME,
+    output_dir: str | None = None,
+    pretty: bool = True,
+    fmt: str = "json",
+    batch_size: int = 1000,
+    compression: str | None = None,
+    workers: int | None = None,
+    partition_size: int = 1_000_000,
+    since_manifest: str | None = None,
+    updated_field: str | None = None,
+    resume: bool = False,
+) -> list[str]:
+    """
+    Export all collections from the specified database to JSON, NDJSON, Parquet or Arrow IPC files.
+
+    Documents are streamed from the cursor in batches of batch_size and written as they
+    arrive, so memory use does not grow with collection size. Collections larger than
+    partition_size are split into _id ranges written to separate part files, and all
+    parts are exported in parallel on a pool of `workers` threads (default: CPU count).
+    A manifest.json listing every part with its filter, count and SHA-256, plus each
+    collection's _id high-water mark, is written last.
+
+    With since_manifest, only documents added since that export (or, given updated_field,
+    modified since it started) are written; see delta_filter for the limits of _id-based
+    detection. Progress is checkpointed after every part;
+    resume=True with the interrupted run's output_dir finishes only the missing parts.
 
     Returns a list of written file paths.
     """
+    if resume and not output_dir:
+        raise ValueError("resume=True requires the output_dir of the interrupted export")
+    if fmt == "arrow" and compression == "gzip":
+        raise ValueError("Arrow IPC files support zstd compression only")
+
     try:
         db = get_db(MONGO_URI, db_name)
     except ServerSelectionTimeoutError as conn_err:
@@ -41,27 +411,98 @@ def export_collections_to_json(db_name: str = DB_NAME, output_dir: str | None =
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     base_output_dir = output_dir or os.path.join("exports", f"{db_name}-{timestamp}")
     ensure_dir(base_output_dir)
+    checkpoint_path = os.path.join(base_output_dir, CHECKPOINT_FILE)
 
-    collections = db.list_collection_names()
-    if not collections:
-        return []
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = read_state(checkpoint_path)
+    else:
+        previous = read_state(since_manifest) if since_manifest else None
+        started_at = datetime.now(timezone.utc)
+        # Parquet and Arrow compress internally, so their file names carry no compression suffix
+        extension = f".{fmt}" if fmt in COLUMNAR_FORMATS else f".{fmt}{COMPRESSION_SUFFIXES[compression]}"
+        tasks, marks, schemas = plan_export(
+            db, db_name, base_output_dir, fmt, extension, partition_size, previous, updated_field
+        )
+        if not tasks:
+            return []
+        checkpoint = {
+            "startedAt": started_at,
+            "mode": "delta" if previous else "full",
+            "base": since_manifest,
+            "format": fmt,
+            "compression": compression,
+            "tasks": tasks,
+            "marks": marks,
+            "schemas": schemas,
+            "done": {},
+        }
+        write_state(checkpoint_path, checkpoint)
+
+    lock = threading.Lock()
+    schemas = {name: deserialize_schema(data) for name, data in checkpoint["schemas"].items()}
+
+    def run(task: dict) -> None:
+        part = export_part(
+            db[task["collection"]], task["filter"], task["path"],
+            checkpoint["format"], pretty, batch_size, checkpoint["compression"], schemas.get(task["collection"])
+        )
+        with lock:
+            checkpoint["done"][task["path"]] = part
+            write_state(checkpoint_path, checkpoint)
 
-    written_files: list[str] = []
-    for collection_name in collections:
-        documents = list(db[collection_name].find({}))
-        file_path = os.path.join(base_output_dir, f"{db_name}_{collection_name}.json")
-        with open(file_path, "w", encoding="utf-8") as f:
-            if pretty:
-                json.dump(documents, f, default=json_util.default, ensure_ascii=False, indent=2)
-            else:
-                json.dump(documents, f, default=json_util.default, ensure_ascii=False)
-        written_files.append(file_path)
+    pending = [task for task in checkpoint["tasks"] if task["path"] not in checkpoint["done"]]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(run, pending))
 
-    return written_files
+    manifest = {
+        "database": db_name,
+        "createdAt": datetime.now(timezone.utc),
+        "startedAt": checkpoint["startedAt"],
+        "mode": checkpoint["mode"],
+        "base": checkpoint["base"],
+        "format": checkpoint["format"],
+        "compression": checkpoint["compression"],
+        "collections": {},
+    }
+    for task in checkpoint["tasks"]:
+        name = task["collection"]
+        entry = manifest["collections"].setdefault(name, {"count": 0, **checkpoint["marks"][name], "parts": []})
+        part = checkpoint["done"][task["path"]]
+        entry["count"] += part["count"]
+        entry["parts"].append(part)
+    manifest_path = os.path.join(base_output_dir, MANIFEST_FILE)
+    write_state(manifest_path, manifest)
+    os.remove(checkpoint_path)
+
+    return [task["path"] for task in checkpoint["tasks"]] + [manifest_path]
 
 
 if __name__ == "__main__":
-    files = export_collections_to_json()
+    parser = argparse.ArgumentParser(description="Export every collection in the database to JSON files.")
+    parser.add_argument("--format", choices=["json", "ndjson", "parquet", "arrow"], default="json",
+                        help="JSON array, one document per line, or typed Parquet/Arrow IPC columns")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], help="Compress output files")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Cursor batch size")
+    parser.add_argument("--compact", action="store_true", help="Do not indent JSON array output")
+    parser.add_argument("--workers", type=int, help="Parallel export threads (default: CPU count)")
+    parser.add_argument("--partition-size", type=int, default=1_000_000, help="Split collections larger than this into _id ranges")
+    parser.add_argument("--since", metavar="MANIFEST", help="Delta export: only documents added since this manifest")
+    parser.add_argument("--updated-field", help="With --since, also export documents whose FIELD changed after that export (needed to catch every change)")
+    parser.add_argument("--resume", metavar="DIR", help="Finish an interrupted export in DIR from its checkpoint")
+    args = parser.parse_args()
+
+    files = export_collections_to_json(
+        output_dir=args.resume,
+        pretty=not args.compact,
+        fmt=args.format,
+        batch_size=args.batch_size,
+        compression=args.compression,
+        workers=args.workers,
+        partition_size=args.partition_size,
+        since_manifest=args.since,
+        updated_field=args.updated_field,
+        resume=bool(args.resume),
+    )
     if files:
         print("Export complete. Files written:")
         for p in files:
@@ -1,7 +1,11 @@
 import os
 import json
+import shutil
+import tempfile
 from glob import glob
-from typing import Iterable, List, Dict, Any
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Tuple
 
 
 CORE_PRESET = [
@@ -22,9 +26,195 @@ META_PRESET = [
     "supplier",
 ]
 
+# Field spec syntax: "[output=]path[|alias_path...][:type]", e.g. "itemId=itemId|ItemID:int"
+# or "supplierName=supplier.name". The first alias present in a document wins.
+AUDIT_PRESET = [
+    "_id",
+    "itemId=itemId|ItemID",
+    "description=description|desc",
+    "quantity:int",
+    "unitPrice:float",
+    "extendedValue:float",
+    "category",
+    "supplier",
+    "auditDate",
+]
+
+INPUT_EXTENSIONS = (".json", ".ndjson", ".jsonl")
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+READ_CHUNK_SIZE = 1 << 20
+# Bookkeeping files export_inventoryaudit writes next to its exports; they hold no documents
+EXPORT_STATE_FILES = ("manifest.json", "checkpoint.json")
+
+
+PROJECTION_BATCH_SIZE = 1000
+
+_MISSING = object()
+
+
+def _coerce(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def coerce(value):
+        if value is None:
+            return None
+        try:
+            return convert(value)
+        except (TypeError, ValueError, OverflowError):
+            return None
+    return coerce
+
+
+# The converters follow $convert's rules so a spec gives the same output locally and on the server
+def _to_int(value) -> int:
+    if isinstance(value, (dict, list)):
+        raise TypeError("objects and arrays do not convert to long")
+    # Strings must hold an integer ("12.5" is an error); doubles are truncated
+    result = int(value)
+    if not -2 ** 63 <= result < 2 ** 63:
+        raise OverflowError("out of range for long")
+    return result
+
+
+def _to_float(value) -> float:
+    if isinstance(value, (dict, list)):
+        raise TypeError("objects and arrays do not convert to double")
+    return float(value)
+
+
+def _to_str(value) -> str:
+    if isinstance(value, (dict, list)):
+        raise TypeError("objects and arrays do not convert to string")
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _to_bool(value) -> bool:
+    if isinstance(value, (dict, list)):
+        raise TypeError("objects and arrays do not convert to bool")
+    # Every string, even "" or "false", converts to true
+    return True if isinstance(value, str) else bool(value)
+
+
+# Values that cannot be converted become None, matching $convert's onError: null
+COERCIONS = {
+    "int": _coerce(_to_int),
+    "float": _coerce(_to_float),
+    "str": _coerce(_to_str),
+    "bool": _coerce(_to_bool),
+}
+MONGO_TYPES = {"int": "long", "float": "double", "str": "string", "bool": "bool"}
+def parse_field(entry: str) -> Tuple[str, List[List[str]], str | None]:
+    """
+    Split a field spec into (output key, alias paths as key lists, coercion type).
+    """
+    type_name = None
+    source = entry
+    if ":" in entry:
+        source, type_name = entry.rsplit(":", 1)
+        if type_name not in COERCIONS:
+            raise ValueError(f"Unknown type '{type_name}' in field spec '{entry}' (use one of {', '.join(COERCIONS)})")
+    output, _, paths = source.rpartition("=")
+    aliases = [alias.split(".") for alias in paths.split("|") if alias]
+    if not aliases:
+        raise ValueError(f"Field spec '{entry}' has no source path")
+    return output or ".".join(aliases[0]), aliases, type_name
+
+
+def _getter(aliases: List[List[str]]) -> Callable[[Dict[str, Any]], Any]:
+    def get_path(doc, path):
+        value = doc
+        for key in path:
+            if value.__class__ is not dict:
+                return _MISSING
+            value = value.get(key, _MISSING)
+        return value
+
+    if len(aliases) == 1 and len(aliases[0]) == 1:
+        key = aliases[0][0]
+        return lambda doc: doc.get(key, _MISSING)
+    if len(aliases) == 1:
+        path = aliases[0]
+        return lambda doc: get_path(doc, path)
+
+    def get_first(doc):
+        for path in aliases:
+            value = get_path(doc, path)
+            if value is not _MISSING:
+                return value
+        return _MISSING
+    return get_first
+
+
+def _setter(output: str) -> Callable[[Dict[str, Any], Any], None]:
+    *parents, leaf = output.split(".")
+    if not parents:
+        return lambda out, value: out.__setitem__(leaf, value)
+
+    def set_nested(out, value):
+        for key in parents:
+            out = out.setdefault(key, {})
+        out[leaf] = value
+    return set_nested
+
+
+@lru_cache(maxsize=64)
+def compile_projection(spec: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Compile a field spec once into (getter, coercer, setter) closures and return a function
+    projecting one document with them. Dotted output keys build nested objects, as in MongoDB.
+    """
+    fields = []
+    for entry in spec:
+        output, aliases, type_name = parse_field(entry)
+        fields.append((_getter(aliases), COERCIONS[type_name] if type_name else None, _setter(output)))
+
+    def project(doc):
+        out: Dict[str, Any] = {}
+        for get, coerce, put in fields:
+            value = get(doc)
+            if value is not _MISSING:
+                put(out, coerce(value) if coerce else value)
+        return out
+    return project
+
+
+def project_batch(documents: Iterable[Dict[str, Any]], keys: Iterable[str]) -> List[Dict[str, Any]]:
+    return list(map(compile_projection(tuple(keys)), documents))
+
+
+def _present(expr: str) -> Dict[str, Any]:
+    return {"$ne": [{"$type": expr}, "missing"]}
+
+
+def mongo_projection(keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Translate a field spec into an equivalent $project stage for filtering inside MongoDB.
+
+    As locally, an alias falls through only when the field is missing (not when it is null),
+    and a field missing under every alias is left out rather than written as null.
+    """
+    project: Dict[str, Any] = {}
+    for entry in keys:
+        output, aliases, type_name = parse_field(entry)
+        paths = [f"${'.'.join(path)}" for path in aliases]
+        if output == "_id" and paths == ["$_id"] and not type_name:
+            project["_id"] = 1
+            continue
+        expr: Any = paths[-1]
+        for path in reversed(paths[:-1]):
+            expr = {"$cond": [_present(path), path, expr]}
+        if type_name:
+            converted = {"$convert": {"input": expr, "to": MONGO_TYPES[type_name], "onError": None, "onNull": None}}
+            expr = {"$cond": [{"$eq": [{"$type": expr}, "missing"]}, "$$REMOVE", converted]}
+        project[output] = expr
+    project.setdefault("_id", 0)
+    return {"$project": project}
+
 
 def filter_document(document: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Any]:
-    return {k: document[k] for k in keys if k in document}
+    return compile_projection(tuple(keys))(document)
 
 
 def read_json(path: str) -> List[Dict[str, Any]]:
@@ -43,40 +233,199 @@ def write_json(path: str, data: List[Dict[str, Any]]):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def filter_folder(input_path: str, output_path: str, keep_keys: Iterable[str]):
+def iter_documents(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the objects in a JSON array, a single JSON object or an NDJSON file one at a time.
+
+    The file is read in chunks and decoded incrementally, so memory use is bounded by the
+    largest single document rather than the file size. Non-object array items are skipped.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+        in_array = None
+
+        def fill() -> bool:
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                return False
+            buf = buf[pos:] + chunk
+            pos = 0
+            return True
+
+        while True:
+            # Skip whitespace and, inside an array, the separating commas
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ",")):
+                    pos += 1
+                if pos < len(buf) or not fill():
+                    break
+            if pos >= len(buf):
+                if in_array:
+                    raise ValueError(f"{path}: unterminated JSON array")
+                return
+            if in_array is None:
+                in_array = buf[pos] == "["
+                if in_array:
+                    pos += 1
+                    continue
+            if in_array and buf[pos] == "]":
+                return
+
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not eof and fill():
+                        continue
+                    raise
+                # A value ending exactly at the buffer edge may be a truncated number
+                if end == len(buf) and not eof and fill():
+                    continue
+                break
+            pos = end
+            if isinstance(value, dict):
+                yield value
+
+
+def filter_file(task: tuple) -> Dict[str, Any]:
+    """
+    Stream one input file through filter_document into a part file of output-ready fragments.
+
+    Documents written before a read error are kept; the error is returned instead of raised.
+    """
+    input_file, part_file, keep_keys, ndjson = task
+    project = compile_projection(tuple(keep_keys))
+    written = 0
+    error = None
+    batch: List[Dict[str, Any]] = []
+    with open(part_file, "w", encoding="utf-8") as out:
+        try:
+            for doc in iter_documents(input_file):
+                batch.append(doc)
+                if len(batch) >= PROJECTION_BATCH_SIZE:
+                    written += write_fragments(map(project, batch), out, ndjson, first=not written)
+                    batch = []
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        # Includes the documents read in the batch the error interrupted
+        written += write_fragments(map(project, batch), out, ndjson, first=not written)
+    return {"file": input_file, "part": part_file, "written": written, "error": error}
+
+
+def write_fragments(documents: Iterable[Dict[str, Any]], out, ndjson: bool, first: bool = True, default=None) -> int:
+    """
+    Write documents as NDJSON lines or as the inside of a json.dump(indent=2) array, returning the count.
+    """
+    count = 0
+    for doc in documents:
+        if ndjson:
+            out.write(json.dumps(doc, ensure_ascii=False, default=default))
+            out.write("\n")
+        else:
+            if count or not first:
+                out.write(",\n  ")
+            out.write(json.dumps(doc, ensure_ascii=False, indent=2, default=default).replace("\n", "\n  "))
+        count += 1
+    return count
+
+
+def filter_collection(collection, output_path: str, keep_keys: Iterable[str], query: Dict[str, Any] | None = None,
+                      batch_size: int = PROJECTION_BATCH_SIZE):
+    """
+    Filter a MongoDB collection straight to an output file, running the projection on the server.
+    """
+    from bson import json_util
+
+    pipeline = ([{"$match": query}] if query else []) + [mongo_projection(keep_keys)]
+    ndjson = output_path.lower().endswith(NDJSON_EXTENSIONS)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as out:
+        cursor = collection.aggregate(pipeline, batchSize=batch_size, allowDiskUse=True)
+        first = next(cursor, None)
+        if not ndjson:
+            out.write("[\n  " if first is not None else "[")
+        written = 0
+        if first is not None:
+            written = write_fragments([first], out, ndjson, default=json_util.default)
+            written += write_fragments(cursor, out, ndjson, first=False, default=json_util.default)
+        if not ndjson:
+            out.write("\n]" if written else "]")
+    return {"collection": collection.name, "written": written, "output": output_path, "errors": []}
+
+
+def filter_folder(input_path: str, output_path: str, keep_keys: Iterable[str], workers: int | None = None):
+    """
+    Filter every JSON/NDJSON file under input_path down to keep_keys and write one output file.
+
+    Files are filtered in parallel on a process pool into temporary part files, which are then
+    concatenated in input order. The output is a JSON array formatted like json.dump(indent=2),
+    or NDJSON when output_path ends in .ndjson/.jsonl.
+    """
     # Collect files
     files: List[str] = []
     if os.path.isdir(input_path):
-        files = glob(os.path.join(input_path, "**", "*.json"), recursive=True)
-    elif os.path.isfile(input_path) and input_path.lower().endswith(".json"):
+        for extension in INPUT_EXTENSIONS:
+            files += glob(os.path.join(input_path, "**", f"*{extension}"), recursive=True)
+        files = sorted(fp for fp in files if os.path.basename(fp) not in EXPORT_STATE_FILES)
+    elif os.path.isfile(input_path) and input_path.lower().endswith(INPUT_EXTENSIONS):
         files = [input_path]
     else:
-        raise ValueError("input_path must be a JSON file or a directory containing JSON files")
+        raise ValueError("input_path must be a JSON/NDJSON file or a directory containing them")
 
-    all_docs: List[Dict[str, Any]] = []
-    for fp in files:
-        try:
-            all_docs.extend(read_json(fp))
-        except Exception:
-            # skip unreadable files
-            pass
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    ndjson = output_path.lower().endswith(NDJSON_EXTENSIONS)
+    keep_keys = list(keep_keys)
+    parts_dir = tempfile.mkdtemp(prefix=".filter-parts-", dir=output_dir)
+    try:
+        tasks = [(fp, os.path.join(parts_dir, f"{i:06d}.part"), keep_keys, ndjson) for i, fp in enumerate(files)]
+        if (workers or os.cpu_count() or 1) > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(filter_file, tasks))
+        else:
+            results = [filter_file(task) for task in tasks]
+
+        written = 0
+        with open(output_path, "w", encoding="utf-8") as out:
+            if not ndjson:
+                out.write("[\n  " if any(r["written"] for r in results) else "[")
+            for result in results:
+                if not result["written"]:
+                    continue
+                if written and not ndjson:
+                    out.write(",\n  ")
+                with open(result["part"], "r", encoding="utf-8") as part:
+                    shutil.copyfileobj(part, out)
+                written += result["written"]
+            if not ndjson:
+                out.write("\n]" if written else "]")
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
 
-    filtered = [filter_document(doc, keep_keys) for doc in all_docs]
-    write_json(output_path, filtered)
-    return {"read_files": len(files), "written": len(filtered), "output": output_path}
+    errors = [{"file": r["file"], "error": r["error"], "written": r["written"]} for r in results if r["error"]]
+    return {"read_files": len(files), "written": written, "output": output_path, "errors": errors}
 
 
 if __name__ == "__main__":
     # Example usage presets:
     # 1) Core fields only -> outputs to filtered_core.json
     # 2) Meta fields only -> outputs to filtered_meta.json
+    # 3) Audit fields with itemId/ItemID and description/desc aliases and numeric coercion
+    # Custom --keys accept the field spec syntax, e.g. --keys itemId=itemId|ItemID supplierName=supplier.name unitPrice:float
     import argparse
 
     parser = argparse.ArgumentParser(description="Filter JSON documents to selected keys and write to a new JSON file.")
-    parser.add_argument("input", help="Input JSON file or directory")
+    parser.add_argument("input", help="Input JSON file or directory (a collection name with --collection)")
     parser.add_argument("output", help="Output JSON file path")
-    parser.add_argument("--preset", choices=["core", "meta"], help="Use a preset set of keys")
+    parser.add_argument("--preset", choices=["core", "meta", "audit"], help="Use a preset set of keys")
     parser.add_argument("--keys", nargs="*", help="Custom keys to keep (overrides preset if provided)")
+    parser.add_argument("--workers", type=int, help="Parallel filter processes (default: CPU count)")
+    parser.add_argument("--collection", action="store_true", help="Read from this MongoDB collection and project on the server")
 
     args = parser.parse_args()
 
@@ -86,10 +435,16 @@ if __name__ == "__main__":
         keep = CORE_PRESET
     elif args.preset == "meta":
         keep = META_PRESET
+    elif args.preset == "audit":
+        keep = AUDIT_PRESET
     else:
-        raise SystemExit("Provide --preset core|meta or --keys <k1> <k2> ...")
-
-    result = filter_folder(args.input, args.output, keep)
-    print(result)
-
+        raise SystemExit("Provide --preset core|meta|audit or --keys <k1> <k2> ...")
 
+    if args.collection:
+        from export_inventoryaudit import get_db, MONGO_URI, DB_NAME
+        result = filter_collection(get_db(MONGO_URI, DB_NAME)[args.input], args.output, keep)
+    else:
+        result = filter_folder(args.input, args.output, keep, workers=args.workers)
+    for failure in result["errors"]:
+        print(f"Error in {failure['file']} after {failure['written']} documents: {failure['error']}")
+    print({k: v for k, v in result.items() if k != "errors"} | {"failed_files": len(result["errors"])})
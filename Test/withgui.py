@@ -4,6 +4,7 @@ from datetime import datetime
 from typing import List, Optional
 
 import pandas as pd
+from textual import work
 from textual.app import App, ComposeResult
 from textual.containers import Container, Horizontal, Vertical
 from textual.widgets import (
@@ -15,13 +16,15 @@ from textual.widgets import (
     Label,
     DataTable,
     Select,
+    ProgressBar,
     TabbedContent,
     TabPane,
     Tabs,
 )
 
-# Reuse backend from a.py
+# Reuse backend from a.py; the Textual app awaits its asyncio mirror
 import a as backend
+import aio_backend
 
 
 class DashboardPane(TabPane):
@@ -56,8 +59,10 @@ class ConfigPane(TabPane):
             yield Input(placeholder="1000", id="threshold")
         yield Static("Preview:", classes="section-title")
         yield Static("Select a collection to see preview.", id="preview")
+        yield ProgressBar(id="audit-progress", show_eta=False)
         with Horizontal(classes="actions"):
             yield Button("Run Audit", variant="success", id="run-audit")
+            yield Button("Cancel", id="cancel-audit", disabled=True)
             yield Button("Reset", id="reset-config")
 
 
@@ -135,18 +140,21 @@ class AuditApp(App):
         self._connect_db()
 
     # Helpers
-    def _connect_db(self) -> None:
+    @work(exclusive=True, group="connect")
+    async def _connect_db(self) -> None:
         conn_status = self.query_one("#conn-status", Static)
         db_name_lbl = self.query_one("#db-name", Static)
         db_colls_lbl = self.query_one("#db-colls", Static)
         try:
-            self.db = backend.connect_to_mongodb()
-            colls = self.db.list_collection_names()
+            self.db = await aio_backend.connect_to_mongodb()
+            names = await aio_backend.list_collections(self.db)
+            # Show the connection and collection names first; item counts follow
             conn_status.update("✓ Successfully connected to MongoDB")
             db_name_lbl.update(f"Database: {backend.DB_NAME}")
-            db_colls_lbl.update(f"Collections found: {len(colls)}")
-            # Populate selects
-            self._populate_collections(colls)
+            db_colls_lbl.update(f"Collections found: {len(names)} (counting items...)")
+            self._populate_collections(names)
+            counts = await aio_backend.count_collections(self.db, names)
+            db_colls_lbl.update(f"Collections found: {len(counts)} (~{sum(counts.values()):,} items)")
         except Exception as e:
             conn_status.update(f"✗ Connection failed: {e}")
             db_name_lbl.update("Database: -")
@@ -167,6 +175,10 @@ class AuditApp(App):
             self.switch_tab("export")
         elif bid == "run-audit":
             self._run_audit_from_config()
+        elif bid == "cancel-audit":
+            self.workers.cancel_group(self, "audit")
+            self._set_audit_running(False)
+            self.notify("Audit cancelled.")
         elif bid == "reset-config":
             self._reset_config()
         elif bid == "scan-integrity":
@@ -188,19 +200,24 @@ class AuditApp(App):
     def _reset_config(self) -> None:
         self.query_one("#collections", Select).clear()
         if self.db is not None:
-            self._populate_collections(self.db.list_collection_names())
+            self._reload_collections()
         self.query_one("#sample-size", Input).value = ""
         self.query_one("#threshold", Input).value = ""
         self.query_one("#preview", Static).update("Select a collection to see preview.")
 
-    def _update_preview(self) -> None:
+    @work(exclusive=True, group="collections")
+    async def _reload_collections(self) -> None:
+        self._populate_collections(await aio_backend.list_collections(self.db))
+
+    @work(exclusive=True, group="preview")
+    async def _update_preview(self) -> None:
         select = self.query_one("#collections", Select)
         name = select.value
         if not name:
             return
         total = 0
         try:
-            total = self.db[name].count_documents({}) if self.db is not None else 0
+            total = await self.db[name].count_documents({}) if self.db is not None else 0
         except Exception:
             total = 0
         sample_str = self.query_one("#sample-size", Input).value or "50"
@@ -238,12 +255,36 @@ class AuditApp(App):
         except Exception:
             self.notify("Invalid inputs; using defaults (50, $1000).")
             sample_size, threshold = 50, 1000.0
+        self._set_audit_running(True)
+        self._audit_worker(name, sample_size, threshold)
+
+    @work(exclusive=True, group="audit")
+    async def _audit_worker(self, name: str, sample_size: int, threshold: float) -> None:
+        # Cancel stops reading the cursor and drops the result; the server-side $sample itself
+        # cannot be interrupted and finishes on the server.
+        bar = self.query_one("#audit-progress", ProgressBar)
         try:
-            coll = self.db[name]
-            sampled = backend.perform_price_testing_audit(coll, sample_size, threshold)
+            sampled = await aio_backend.perform_price_testing_audit(
+                self.db[name], sample_size, threshold,
+                progress=lambda done, total: bar.update(total=total, progress=done)
+            )
         except Exception as e:
-            self.notify(f"Audit error: {e}")
+            self._audit_failed(str(e))
             return
+        self._audit_finished(name, sampled)
+
+    def _set_audit_running(self, running: bool) -> None:
+        self.query_one("#run-audit", Button).disabled = running
+        self.query_one("#cancel-audit", Button).disabled = not running
+        # Indeterminate until the first sampled document arrives from the server
+        self.query_one("#audit-progress", ProgressBar).update(total=None if running else 100, progress=0)
+
+    def _audit_failed(self, message: str) -> None:
+        self._set_audit_running(False)
+        self.notify(f"Audit error: {message}")
+
+    def _audit_finished(self, name: str, sampled: List[dict]) -> None:
+        self._set_audit_running(False)
         self.selected_collection = name
         self.sampled_items = sampled
         self._render_results()
@@ -256,29 +297,22 @@ class AuditApp(App):
         if not name:
             self.notify("Please select a collection.")
             return
-        coll = self.db[name]
-        total_count = coll.count_documents({})
-        checks = {
-            "Missing ItemID": coll.count_documents({'itemId': {'$exists': False}}),
-            "Missing Price": coll.count_documents({'unitPrice': {'$exists': False}}),
-            "Missing Quantity": coll.count_documents({'quantity': {'$exists': False}}),
-            "Negative Price": coll.count_documents({'unitPrice': {'$lt': 0}}),
-            "Negative Qty": coll.count_documents({'quantity': {'$lt': 0}}),
-        }
+        self._scan_integrity_worker(name)
+
+    @work(exclusive=True, group="integrity")
+    async def _scan_integrity_worker(self, name: str) -> None:
+        # An explicit Scan always reads the collection again rather than reusing a cached report
+        report = await aio_backend.scan_integrity(self.db[name], max_age=0)
+        total_count = report['total']
         table = self.query_one("#integrity-table", DataTable)
         table.clear()
-        for label, count in checks.items():
+        for label, count in report['checks'].items():
             percent = (count / total_count * 100) if total_count else 0
             status = "PASS" if count == 0 else "WARN"
             table.add_row(label, status, str(count), f"{percent:.1f}%")
-        pipeline = [
-            {'$match': {'unitPrice': {'$exists': True}, 'quantity': {'$exists': True}}},
-            {'$project': {'totalValue': {'$multiply': ['$unitPrice', '$quantity']}}},
-            {'$group': {'_id': None, 'totalInventoryValue': {'$sum': '$totalValue'}}}
-        ]
-        result = list(coll.aggregate(pipeline))
-        total_value = result[0]['totalInventoryValue'] if result else 0
-        self.query_one("#integrity-total", Static).update(f"Total Inventory Value: ${total_value:,.2f}")
+        self.query_one("#integrity-total", Static).update(
+            f"Total Inventory Value: ${report['totalValue']:,.2f} | Scanned at {report['scannedAt']:%H:%M:%S}"
+        )
 
     # Results actions
     def _render_results(self) -> None:
@@ -304,19 +338,11 @@ class AuditApp(App):
             self.notify("No data to export.")
             return
         filename = f"audit_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        df = pd.DataFrame([
-            {
-                'Item ID': i.get('itemId', 'N/A'),
-                'Description': i.get('description', 'N/A'),
-                'Unit Price': i.get('unitPrice', 0),
-                'Quantity': i.get('quantity', 0),
-                'Extended Value': i.get('extendedValue', 0),
-                'Category': i.get('category', 'N/A'),
-                'Supplier': i.get('supplier', 'N/A'),
-                'Audit Date': datetime.now().strftime('%Y-%m-%d')
-            } for i in self.sampled_items
-        ])
-        df.to_csv(filename, index=False)
+        self._export_worker(filename)
+
+    @work(exclusive=True, group="export")
+    async def _export_worker(self, filename: str) -> None:
+        df = await aio_backend.export_audit_results(self.sampled_items, filename)
         info = (
             f"✓ Audit results successfully exported to:\n\n"
             f"  {filename}\n\n"
@@ -334,6 +360,8 @@ if __name__ == "__main__":
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
+import queue
+import threading
 import pandas as pd
 
 # Reuse backend from a.py via import
@@ -372,6 +400,50 @@ class AuditApp(tk.Tk):
             self.frames["Dashboard"].update_status(connected=False, db_name="-", collections=[])
             messagebox.showerror("Connection Error", str(e))
 
+    # Runs fn(progress) on a worker thread and hands results back to Tk via after() polling.
+    # Setting the returned Event discards the outcome at once and makes the worker raise
+    # AuditCancelled at its next progress call. Work between calls is not interrupted: a
+    # materialize batch or the single server-side $sample draw runs to completion first.
+    def run_in_background(self, fn, on_done, on_error, on_progress=None):
+        events = queue.Queue()
+        cancel = threading.Event()
+
+        def progress(done, total):
+            if cancel.is_set():
+                raise backend.AuditCancelled()
+            events.put(('progress', (done, total)))
+
+        def target():
+            try:
+                events.put(('done', fn(progress)))
+            except backend.AuditCancelled:
+                events.put(('cancelled', None))
+            except Exception as e:
+                events.put(('error', e))
+
+        def poll():
+            while True:
+                try:
+                    kind, payload = events.get_nowait()
+                except queue.Empty:
+                    self.after(100, poll)
+                    return
+                if kind == 'progress':
+                    if on_progress and not cancel.is_set():
+                        on_progress(*payload)
+                    continue
+                if cancel.is_set():
+                    return
+                if kind == 'done':
+                    on_done(payload)
+                elif kind == 'error':
+                    on_error(payload)
+                return
+
+        threading.Thread(target=target, daemon=True).start()
+        self.after(100, poll)
+        return cancel
+
     def show_frame(self, name):
         frame = self.frames[name]
         frame.tkraise()
@@ -447,10 +519,17 @@ class ConfigScreen(ttk.Frame):
         self.preview = tk.Text(self, height=6, state=tk.DISABLED)
         self.preview.pack(fill=tk.X, padx=12, pady=6)
 
+        self.progress = ttk.Progressbar(self, mode="determinate", maximum=100)
+        self.progress.pack(fill=tk.X, padx=12, pady=4)
+        self.cancel_event = None
+
         bottom = ttk.Frame(self)
         bottom.pack(pady=8)
         ttk.Button(bottom, text="Cancel", command=lambda: controller.show_frame("Dashboard")).grid(row=0, column=0, padx=8)
-        ttk.Button(bottom, text="Run Audit", command=self.run_audit).grid(row=0, column=1, padx=8)
+        self.run_btn = ttk.Button(bottom, text="Run Audit", command=self.run_audit)
+        self.run_btn.grid(row=0, column=1, padx=8)
+        self.stop_btn = ttk.Button(bottom, text="Stop Audit", command=self.stop_audit, state=tk.DISABLED)
+        self.stop_btn.grid(row=0, column=2, padx=8)
 
         self.tree.bind("<<TreeviewSelect>>", lambda e: self.update_preview())
 
@@ -499,14 +578,44 @@ class ConfigScreen(ttk.Frame):
         sample_size = max(1, min(500, self.sample_var.get()))
         threshold = max(0.0, float(self.threshold_var.get()))
         coll = self.controller.db[name]
-        try:
-            sampled_items = backend.perform_price_testing_audit(coll, sample_size, threshold)
-        except Exception as e:
-            messagebox.showerror("Audit Error", str(e))
+        self.set_running(True)
+        self.cancel_event = self.controller.run_in_background(
+            lambda progress: backend.perform_price_testing_audit(coll, sample_size, threshold, progress=progress),
+            on_done=self.audit_finished,
+            on_error=self.audit_failed,
+            on_progress=self.update_progress
+        )
+
+    def set_running(self, running):
+        self.run_btn.config(state=tk.DISABLED if running else tk.NORMAL)
+        self.stop_btn.config(state=tk.NORMAL if running else tk.DISABLED)
+        self.progress.stop()
+        # Indeterminate until the backend reports real progress
+        self.progress.config(mode="indeterminate" if running else "determinate", value=0)
+        if running:
+            self.progress.start(10)
+
+    def update_progress(self, done, total):
+        if total is None:
+            # Still working, size unknown: keep the indeterminate animation
             return
+        self.progress.stop()
+        self.progress.config(mode="determinate", value=(done / total * 100) if total else 100)
+
+    def stop_audit(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.set_running(False)
+
+    def audit_finished(self, sampled_items):
+        self.set_running(False)
         self.controller.sampled_items = sampled_items
         self.controller.show_frame("ResultsScreen")
 
+    def audit_failed(self, error):
+        self.set_running(False)
+        messagebox.showerror("Audit Error", str(error))
+
 
 class IntegrityScreen(ttk.Frame):
     def __init__(self, parent, controller):
@@ -523,8 +632,8 @@ class IntegrityScreen(ttk.Frame):
         ttk.Button(top, text="Scan", command=self.scan).pack(side=tk.LEFT, padx=8)
         ttk.Button(top, text="Back", command=lambda: controller.show_frame("Dashboard")).pack(side=tk.LEFT)
 
-        self.table = ttk.Treeview(self, columns=("status", "count", "percent"), show="headings")
-        for col, w in (("status", 100), ("count", 100), ("percent", 100)):
+        self.table = ttk.Treeview(self, columns=("check", "status", "count", "percent"), show="headings")
+        for col, w in (("check", 160), ("status", 100), ("count", 100), ("percent", 100)):
             self.table.heading(col, text=col.capitalize())
             self.table.column(col, width=w, anchor=tk.CENTER)
         self.table.pack(fill=tk.BOTH, expand=True, padx=12, pady=12)
@@ -544,28 +653,24 @@ class IntegrityScreen(ttk.Frame):
             messagebox.showinfo("Select Collection", "Please select a collection.")
             return
         coll = self.controller.db[name]
-        total_count = coll.count_documents({})
-        checks = {
-            "Missing ItemID": coll.count_documents({'itemId': {'$exists': False}}),
-            "Missing Price": coll.count_documents({'unitPrice': {'$exists': False}}),
-            "Missing Quantity": coll.count_documents({'quantity': {'$exists': False}}),
-            "Negative Price": coll.count_documents({'unitPrice': {'$lt': 0}}),
-            "Negative Qty": coll.count_documents({'quantity': {'$lt': 0}}),
-        }
+        self.controller.run_in_background(
+            # An explicit Scan always reads the collection again rather than reusing a cached report
+            lambda progress: backend.integrity_report(coll, max_age=0),
+            on_done=self.show_report,
+            on_error=lambda e: messagebox.showerror("Integrity Error", str(e))
+        )
+
+    def show_report(self, report):
+        total_count = report['total']
         for row in self.table.get_children():
             self.table.delete(row)
-        for label, count in checks.items():
+        for label, count in report['checks'].items():
             percent = (count / total_count * 100) if total_count else 0
             status = "PASS" if count == 0 else "WARN"
-            self.table.insert('', tk.END, values=(status, count, f"{percent:.1f}%"))
-        pipeline = [
-            {'$match': {'unitPrice': {'$exists': True}, 'quantity': {'$exists': True}}},
-            {'$project': {'totalValue': {'$multiply': ['$unitPrice', '$quantity']}}},
-            {'$group': {'_id': None, 'totalInventoryValue': {'$sum': '$totalValue'}}}
-        ]
-        result = list(coll.aggregate(pipeline))
-        total_value = result[0]['totalInventoryValue'] if result else 0
-        self.total_value_label.config(text=f"Total Inventory Value: ${total_value:,.2f}")
+            self.table.insert('', tk.END, values=(label, status, count, f"{percent:.1f}%"))
+        self.total_value_label.config(
+            text=f"Total Inventory Value: ${report['totalValue']:,.2f} | Scanned at {report['scannedAt']:%H:%M:%S}"
+        )
 
 
 class ResultsScreen(ttk.Frame):
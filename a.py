@@ -1,7 +1,12 @@
 from pymongo import MongoClient, UpdateOne
 from pymongo.errors import ServerSelectionTimeoutError
+from bson import Decimal128
 import pandas as pd
 import random
+import os
+import json
+import time
+import argparse
 from datetime import datetime
 
 
@@ -23,28 +28,254 @@ def cleanup_extended_values(collection):
     collection.update_many({}, {'$unset': {'extendedValue': ''}})
     print("Cleared 'extendedValue' on collection")
 
-def calculate_extended_values(collection):
-    items = collection.find({}, {'_id': 1, 'unitPrice': 1, 'quantity': 1})
+class AuditCancelled(Exception):
+    pass
+
+# unitPrice * quantity with missing/null counted as 0. Any other non-numeric value (e.g. the
+# string "$1,000") gives null instead of failing the whole aggregation, so $gt filters drop it.
+EXTENDED_VALUE_EXPR = {'$cond': [
+    {'$and': [{'$isNumber': {'$ifNull': ['$unitPrice', 0]}}, {'$isNumber': {'$ifNull': ['$quantity', 0]}}]},
+    {'$multiply': [{'$ifNull': ['$unitPrice', 0]}, {'$ifNull': ['$quantity', 0]}]},
+    None
+]}
+# Documents whose stored extendedValue no longer matches unitPrice * quantity (or was never set).
+STALE_EXTENDED_VALUE = {'$expr': {'$ne': ['$extendedValue', EXTENDED_VALUE_EXPR]}}
+STATE_FILE = 'audit_state.json'
+
+# Python counterpart of EXTENDED_VALUE_EXPR, used when materializing extendedValue
+def extended_value(doc):
+    values = []
+    for field in ('unitPrice', 'quantity'):
+        v = doc.get(field)
+        if v is None:
+            v = 0
+        elif isinstance(v, Decimal128):
+            v = float(v.to_decimal())
+        elif isinstance(v, bool) or not isinstance(v, (int, float)):
+            return None
+        values.append(v)
+    return values[0] * values[1]
+
+# Streams the cursor and flushes unordered bulk_write batches of batch_size, so memory stays
+# flat regardless of collection size. progress(done, total) is called after every batch.
+def calculate_extended_values(collection, incremental=False, batch_size=1000, progress=None):
+    query = STALE_EXTENDED_VALUE if incremental else {}
+    total = collection.count_documents(query) if progress else None
+    items = collection.find(query, {'_id': 1, 'unitPrice': 1, 'quantity': 1}, batch_size=batch_size)
     ops = []
+    done = 0
     for it in items:
-        ev = (it.get('unitPrice') or 0) * (it.get('quantity') or 0)
+        ev = extended_value(it)
         ops.append(UpdateOne({'_id': it['_id']}, {'$set': {'extendedValue': ev}}))
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            done += len(ops)
+            ops = []
+            if progress:
+                progress(done, total)
     if ops:
-        collection.bulk_write(ops)
-
-def perform_price_testing_audit(collection, sample_size, threshold_value):
-    calculate_extended_values(collection)
-    query = {'extendedValue': {'$gt': threshold_value}}
-    proj = {'itemId': 1, 'description': 1, 'unitPrice': 1, 'quantity': 1, 'extendedValue': 1, 'category': 1, 'supplier': 1}
-    items = list(collection.find(query, proj))
-    if not items:
+        collection.bulk_write(ops, ordered=False)
+        done += len(ops)
+    if progress:
+        progress(done, total)
+    return done
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+# Optional change-stream consumer: keeps extendedValue current as unitPrice/quantity change.
+# The resume token is stored per collection in STATE_FILE so a restart picks up where it left off.
+def watch_extended_values(collection, max_events=None):
+    key = collection.full_name
+    state = load_state()
+    pipeline = [{'$match': {'$or': [
+        {'operationType': {'$in': ['insert', 'replace']}},
+        {'updateDescription.updatedFields.unitPrice': {'$exists': True}},
+        {'updateDescription.updatedFields.quantity': {'$exists': True}},
+    ]}}]
+    handled = 0
+    with collection.watch(pipeline, full_document='updateLookup', resume_after=state.get(key)) as stream:
+        for change in stream:
+            doc = change.get('fullDocument')
+            if doc:
+                ev = extended_value(doc)
+                if doc.get('extendedValue') != ev:
+                    collection.update_one({'_id': doc['_id']}, {'$set': {'extendedValue': ev}})
+            state[key] = stream.resume_token
+            save_state(state)
+            handled += 1
+            if max_events and handled >= max_events:
+                break
+    return handled
+
+AUDIT_PROJECTION = {'itemId': 1, 'description': 1, 'unitPrice': 1, 'quantity': 1, 'extendedValue': 1, 'category': 1, 'supplier': 1}
+
+# Computes extendedValue and keeps only items above threshold, on the server.
+def candidate_stages(threshold_value):
+    return [
+        {'$addFields': {'extendedValue': EXTENDED_VALUE_EXPR}},
+        {'$match': {'extendedValue': {'$gt': threshold_value}}},
+    ]
+
+# Computes extendedValue, filters and samples on the server; nothing is written back.
+def price_testing_pipeline(sample_size, threshold_value):
+    return candidate_stages(threshold_value) + [
+        {'$sample': {'size': sample_size}},
+        {'$project': AUDIT_PROJECTION},
+    ]
+
+# --- Sampling engine: every sampler makes one pass over a cursor and keeps O(sample_size) items.
+
+SAMPLING_METHODS = ('random', 'reservoir', 'mus', 'stratified')
+
+def stratum_key(it):
+    return (it.get('category'), it.get('supplier'))
+
+def reservoir_sample(items, sample_size, seed=None):
+    rng = random.Random(seed)
+    sample = []
+    for seen, it in enumerate(items):
+        if seen < sample_size:
+            sample.append(it)
+        else:
+            j = rng.randint(0, seen)
+            if j < sample_size:
+                sample[j] = it
+    return sample
+
+# Monetary-unit sampling: every dollar has the same chance of selection, so an item is
+# picked with probability proportional to its value. Items worth more than the sampling
+# interval are always picked (once).
+def monetary_unit_sample(items, sample_size, total_value, seed=None, value=lambda it: it.get('extendedValue') or 0):
+    if total_value <= 0 or sample_size <= 0:
+        return []
+    rng = random.Random(seed)
+    interval = total_value / sample_size
+    next_hit = rng.uniform(0, interval)
+    cumulative = 0
+    sample = []
+    for it in items:
+        v = value(it)
+        if v <= 0:
+            continue
+        cumulative += v
+        if cumulative > next_hit:
+            sample.append(it)
+            while next_hit < cumulative:
+                next_hit += interval
+    return sample
+
+# Proportional (largest remainder) allocation of sample_size across strata.
+def allocate_strata(counts, sample_size):
+    total = sum(counts.values())
+    if total == 0:
+        return {k: 0 for k in counts}
+    n = min(sample_size, total)
+    quotas = {k: n * c / total for k, c in counts.items()}
+    alloc = {k: int(q) for k, q in quotas.items()}
+    leftover = n - sum(alloc.values())
+    for k in sorted(quotas, key=lambda k: quotas[k] - alloc[k], reverse=True)[:leftover]:
+        alloc[k] += 1
+    return alloc
+
+# With counts known up front each stratum keeps a reservoir of its allocation (O(sample_size)).
+# Without counts each stratum keeps up to sample_size items and is cut down once totals are known.
+def stratified_sample(items, sample_size, counts=None, seed=None, key=stratum_key):
+    rng = random.Random(seed)
+    alloc = allocate_strata(counts, sample_size) if counts is not None else None
+    reservoirs, seen = {}, {}
+    for it in items:
+        k = key(it)
+        cap = alloc.get(k, 0) if alloc is not None else sample_size
+        i = seen.get(k, 0)
+        seen[k] = i + 1
+        res = reservoirs.setdefault(k, [])
+        if i < cap:
+            res.append(it)
+        else:
+            j = rng.randint(0, i)
+            if j < cap:
+                res[j] = it
+    if alloc is None:
+        alloc = allocate_strata(seen, sample_size)
+    sample = []
+    for k in sorted(reservoirs, key=str):
+        res = reservoirs[k]
+        n = alloc.get(k, 0)
+        sample.extend(res if len(res) <= n else rng.sample(res, n))
+    return sample
+
+# Calls progress(done, None) every `every` documents; the total is unknown while streaming.
+# A progress callback that raises (e.g. AuditCancelled) stops the draw at that point.
+def with_progress(items, progress, every=1000):
+    done = 0
+    for it in items:
+        yield it
+        done += 1
+        if progress and done % every == 0:
+            progress(done, None)
+
+def draw_sample(collection, stages, sample_size, method="random", seed=None, progress=None):
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"Unknown sampling method: {method}")
+    if method == "random" and seed is None:
+        # One server round-trip: it can only be cancelled before it starts, not while it runs
+        return list(collection.aggregate(stages + [{'$sample': {'size': sample_size}}, {'$project': AUDIT_PROJECTION}]))
+    # Stream in _id order so a seeded draw is reproducible
+    def cursor():
+        return with_progress(collection.aggregate([{'$sort': {'_id': 1}}] + stages + [{'$project': AUDIT_PROJECTION}]), progress)
+    if method in ('random', 'reservoir'):
+        return reservoir_sample(cursor(), sample_size, seed)
+    if method == 'mus':
+        res = list(collection.aggregate(stages + [{'$group': {'_id': None, 'total': {'$sum': '$extendedValue'}}}]))
+        return monetary_unit_sample(cursor(), sample_size, res[0]['total'] if res else 0, seed)
+    groups = collection.aggregate(stages + [{'$group': {
+        '_id': {'category': '$category', 'supplier': '$supplier'}, 'count': {'$sum': 1}
+    }}])
+    counts = {stratum_key(g['_id']): g['count'] for g in groups}
+    return stratified_sample(cursor(), sample_size, counts, seed)
+
+# engine="pipeline" computes extendedValue on the server without writing;
+# engine="materialize" stores extendedValue on every changed document first.
+# progress(done, total) is called before the draw, while streamed draws run and at the end
+# (total is None while unknown); each call is a point where the audit can be cancelled.
+def perform_price_testing_audit(collection, sample_size, threshold_value, engine="pipeline", progress=None, method="random", seed=None):
+    if engine == "pipeline":
+        stages = candidate_stages(threshold_value)
+        if progress:
+            progress(0, None)
+    elif engine == "materialize":
+        updated = calculate_extended_values(collection, incremental=True, progress=progress)
+        print(f"Recomputed extendedValue on {updated} changed documents")
+        stages = [{'$match': {'extendedValue': {'$gt': threshold_value}}}]
+    else:
+        raise ValueError(f"Unknown audit engine: {engine}")
+    sampled = draw_sample(collection, stages, sample_size, method, seed, progress)
+    if progress:
+        progress(1, 1)
+    if not sampled:
         print("No items exceed threshold.")
         return []
-    sampled = items if len(items) <= sample_size else random.sample(items, sample_size)
     total = sum(it.get('extendedValue', 0) for it in sampled)
     print(f"Selected {len(sampled)} items (total sampled value: ${total:,.2f})")
     return sampled
 
+# Output format follows the file extension: .parquet and .arrow/.feather keep typed columns, anything else is CSV
+def write_frame(df, filename):
+    if filename.endswith('.parquet'):
+        df.to_parquet(filename, index=False)
+    elif filename.endswith(('.arrow', '.feather')):
+        df.to_feather(filename)
+    else:
+        df.to_csv(filename, index=False)
+
 def export_audit_results(sampled_items, filename="audit_results.csv"):
     df = pd.DataFrame([
         {
@@ -60,10 +291,85 @@ def export_audit_results(sampled_items, filename="audit_results.csv"):
         for it in sampled_items
     ])
     if filename:
-        df.to_csv(filename, index=False)
+        write_frame(df, filename)
         print(f"Exported {len(df)} rows to {filename}")
     return df
 
+# --- Integrity engine: every check is computed in one $facet pass over the collection.
+
+INTEGRITY_CACHE_SECONDS = 300
+INTEGRITY_CACHE = {}
+
+def is_missing(field):
+    return {'$eq': [{'$type': f'${field}'}, 'missing']}
+
+def is_negative(field):
+    return {'$and': [{'$isNumber': f'${field}'}, {'$lt': [f'${field}', 0]}]}
+
+def is_non_numeric(field):
+    return {'$and': [{'$not': [is_missing(field)]}, {'$not': [{'$isNumber': f'${field}'}]}]}
+
+INTEGRITY_CHECKS = {
+    "Missing ItemID": is_missing('itemId'),
+    "Missing Price": is_missing('unitPrice'),
+    "Missing Quantity": is_missing('quantity'),
+    "Negative Price": is_negative('unitPrice'),
+    "Negative Qty": is_negative('quantity'),
+    "Non-numeric Price": is_non_numeric('unitPrice'),
+    "Non-numeric Qty": is_non_numeric('quantity'),
+}
+
+def integrity_pipeline():
+    counts = {f'c{i}': {'$sum': {'$cond': [cond, 1, 0]}} for i, cond in enumerate(INTEGRITY_CHECKS.values())}
+    both_numeric = {'$and': [{'$isNumber': '$unitPrice'}, {'$isNumber': '$quantity'}]}
+    return [{'$facet': {
+        'checks': [{'$group': {
+            '_id': None,
+            'total': {'$sum': 1},
+            'totalValue': {'$sum': {'$cond': [both_numeric, {'$multiply': ['$unitPrice', '$quantity']}, 0]}},
+            **counts,
+        }}],
+        # Extra documents that share an itemId with an earlier one
+        'duplicates': [
+            {'$match': {'itemId': {'$exists': True}}},
+            {'$group': {'_id': '$itemId', 'n': {'$sum': 1}}},
+            {'$match': {'n': {'$gt': 1}}},
+            {'$group': {'_id': None, 'extra': {'$sum': {'$subtract': ['$n', 1]}}}},
+        ],
+    }}]
+
+def summarize_integrity(result):
+    facet = result[0] if result else {}
+    row = facet.get('checks') or [{}]
+    row = row[0] if row else {}
+    dup = facet.get('duplicates') or []
+    checks = {label: row.get(f'c{i}', 0) for i, label in enumerate(INTEGRITY_CHECKS)}
+    checks["Duplicate ItemID"] = dup[0]['extra'] if dup else 0
+    return {'total': row.get('total', 0), 'checks': checks, 'totalValue': row.get('totalValue', 0), 'scannedAt': datetime.now()}
+
+def cached_integrity(collection, max_age):
+    hit = INTEGRITY_CACHE.get(collection.full_name)
+    if hit and max_age and time.time() - hit[0] < max_age:
+        return hit[1]
+    return None
+
+# Reuses a report up to max_age seconds old (max_age=0 always rescans); report['scannedAt'] says when it was taken.
+def integrity_report(collection, max_age=INTEGRITY_CACHE_SECONDS):
+    report = cached_integrity(collection, max_age)
+    if report is None:
+        report = summarize_integrity(list(collection.aggregate(integrity_pipeline(), allowDiskUse=True)))
+        INTEGRITY_CACHE[collection.full_name] = (time.time(), report)
+    return report
+
+def print_integrity(db, names=None):
+    for name in names or db.list_collection_names():
+        report = integrity_report(db[name], max_age=0)
+        print(f"\n=== {name}: {report['total']:,} documents ===")
+        for label, count in report['checks'].items():
+            percent = (count / report['total'] * 100) if report['total'] else 0
+            print(f"{label:<20} {'PASS' if count == 0 else 'WARN':<5} {count:>10,} {percent:6.1f}%")
+        print(f"Total Inventory Value: ${report['totalValue']:,.2f}")
+
 def prompt(prompt_text, cast=str, validate=None, default=None):
     while True:
         try:
@@ -92,17 +398,23 @@ def main():
     coll_name = collections[idx - 1]
     sample_size = prompt("Sample size [default 50]: ", cast=int, default=50, validate=lambda x: x > 0)
     threshold = prompt("Threshold value [$] [default 1000]: ", cast=float, default=1000.0, validate=lambda x: x >= 0)
+    method = prompt(f"Sampling method {SAMPLING_METHODS} [default random]: ", default="random", validate=lambda x: x in SAMPLING_METHODS)
+    seed = prompt("Seed (blank for none): ", cast=lambda x: int(x) if x else None, default="")
     coll = db[coll_name]
-    sampled = perform_price_testing_audit(coll, sample_size, threshold)
+    sampled = perform_price_testing_audit(coll, sample_size, threshold, method=method, seed=seed if seed != "" else None)
     if not sampled:
         return
     if prompt("Export results to CSV? (Y/n): ", cast=str, default="Y").upper().startswith("Y"):
         fname = f"audit_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         export_audit_results(sampled, filename=fname)
-    else:
-        cleanup_extended_values(coll)
     print("=== AUDIT COMPLETE ===")
     print(f"Sampled {len(sampled)} items from '{coll_name}'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MongoDB inventory price testing audit")
+    parser.add_argument("--integrity", nargs="*", metavar="COLLECTION", help="print the data integrity report (all collections if none given) and exit")
+    args = parser.parse_args()
+    if args.integrity is not None:
+        print_integrity(connect_to_mongodb(), args.integrity)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+import a as backend
+from a import MONGO_URI, DB_NAME
+
+# asyncio mirror of the a.py backend for the Textual dashboard. Every function takes the
+# database/collection it works on, so a local mongod or a Motor-compatible in-memory
+# stand-in can be passed in through connect_to_mongodb(client=...).
+
+async def connect_to_mongodb(uri=MONGO_URI, db_name=DB_NAME, client=None):
+    if client is None:
+        # motor is only needed for a real connection, not for an injected stand-in client
+        try:
+            from motor.motor_asyncio import AsyncIOMotorClient
+        except ImportError as import_error:
+            raise RuntimeError("The async backend requires motor. Install it with: pip install motor") from import_error
+        client = AsyncIOMotorClient(uri, serverSelectionTimeoutMS=20000)
+    await client.admin.command('ping')
+    return client[db_name]
+
+async def list_collections(db):
+    return await db.list_collection_names()
+
+# Counts come from collection metadata (estimated_document_count), so no collection is scanned
+async def count_collections(db, names=None):
+    names = names if names is not None else await db.list_collection_names()
+    counts = await asyncio.gather(*(db[name].estimated_document_count() for name in names))
+    return dict(zip(names, counts))
+
+# progress(received, sample_size) is called as each sampled document arrives. Cancelling the
+# awaiting task stops reading the cursor; a $sample already running on the server finishes there.
+async def perform_price_testing_audit(collection, sample_size, threshold_value, progress=None):
+    sampled = []
+    async for doc in collection.aggregate(backend.price_testing_pipeline(sample_size, threshold_value)):
+        sampled.append(doc)
+        if progress:
+            progress(len(sampled), sample_size)
+    return sampled
+
+async def scan_integrity(collection, max_age=backend.INTEGRITY_CACHE_SECONDS):
+    report = backend.cached_integrity(collection, max_age)
+    if report is None:
+        result = await collection.aggregate(backend.integrity_pipeline(), allowDiskUse=True).to_list(length=1)
+        report = backend.summarize_integrity(result)
+        backend.INTEGRITY_CACHE[collection.full_name] = (time.time(), report)
+    return report
+
+async def scan_collections(db, names):
+    reports = await asyncio.gather(*(scan_integrity(db[name]) for name in names))
+    return dict(zip(names, reports))
+
+async def export_audit_results(sampled_items, filename="audit_results.csv"):
+    return await asyncio.to_thread(backend.export_audit_results, sampled_items, filename)
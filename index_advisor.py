@@ -0,0 +1,107 @@
+import argparse
+
+import a as backend
+
+# Filter shape issued by each audit type (with representative values for explain())
+# and the index that turns its COLLSCAN into an IXSCAN.
+AUDIT_QUERY_SHAPES = {
+    "Price Testing (materialize)": ({'extendedValue': {'$gt': 1000}}, [('extendedValue', -1)]),
+    "Price Testing by Category": ({'category': '', 'extendedValue': {'$gt': 1000}}, [('category', 1), ('extendedValue', -1)]),
+    "Low Stock": ({'quantity': {'$lt': 10}}, [('quantity', 1)]),
+    "High Unit Price": ({'unitPrice': {'$gt': 1000}}, [('unitPrice', -1)]),
+}
+
+# Aggregations the audits run as-is. The default engine="pipeline" computes extendedValue in
+# $addFields before filtering on it, so no index can serve it: only engine="materialize"
+# (which filters on the stored field) benefits from the extendedValue index above.
+AUDIT_PIPELINE_SHAPES = {
+    "Price Testing (pipeline)": backend.candidate_stages(1000),
+}
+
+# Normalized-schema collections manage their own indexes in normalized_audit.py
+SKIP_COLLECTIONS = {'items', 'categories', 'inventory', 'audit_view',
+                    'items_shadow', 'categories_shadow', 'inventory_shadow'}
+
+def plan_stages(plan):
+    plan = plan.get('queryPlan', plan)
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages += plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    return [s for s in stages if s]
+
+def access_path(collection, query):
+    stages = plan_stages(collection.find(query).explain()['queryPlanner']['winningPlan'])
+    if 'COLLSCAN' in stages:
+        return 'COLLSCAN'
+    return 'IXSCAN' if 'IXSCAN' in stages else '/'.join(stages)
+
+def pipeline_access_path(collection, pipeline):
+    explain = collection.database.command(
+        'explain', {'aggregate': collection.name, 'pipeline': pipeline, 'cursor': {}}, verbosity='queryPlanner'
+    )
+    # The plan is at the top level when the whole pipeline is pushed into the query layer,
+    # otherwise under the first stage's $cursor
+    planner = explain.get('queryPlanner') or explain.get('stages', [{}])[0].get('$cursor', {}).get('queryPlanner', {})
+    stages = plan_stages(planner.get('winningPlan', {}))
+    if 'COLLSCAN' in stages:
+        return 'COLLSCAN'
+    return 'IXSCAN' if 'IXSCAN' in stages else '/'.join(stages)
+
+def has_index(collection, keys):
+    wanted = [field for field, _ in keys]
+    for index in collection.list_indexes():
+        fields = list(index['key'])
+        if fields[:len(wanted)] == wanted:
+            return True
+    return False
+
+def advise_indexes(collection, apply=False):
+    report = []
+    for audit_type, (query, keys) in AUDIT_QUERY_SHAPES.items():
+        before = access_path(collection, query)
+        missing = not has_index(collection, keys)
+        if missing and apply:
+            collection.create_index(keys)
+        after = access_path(collection, query) if missing and apply else before
+        report.append({
+            'audit': audit_type,
+            'index': ', '.join(f"{field}:{direction}" for field, direction in keys),
+            'missing': missing,
+            'created': missing and apply,
+            'before': before,
+            'after': after,
+        })
+    for audit_type, pipeline in AUDIT_PIPELINE_SHAPES.items():
+        path = pipeline_access_path(collection, pipeline)
+        report.append({
+            'audit': audit_type,
+            'index': 'none possible: computed in $addFields',
+            'missing': False,
+            'created': False,
+            'before': path,
+            'after': path,
+        })
+    return report
+
+def provision_indexes(db, names=None, apply=True):
+    names = names or [n for n in db.list_collection_names() if n not in SKIP_COLLECTIONS]
+    reports = {}
+    for name in names:
+        reports[name] = advise_indexes(db[name], apply=apply)
+        print(f"\n=== {name} ===")
+        for row in reports[name]:
+            action = "created" if row['created'] else ("missing" if row['missing'] else ("n/a" if row['index'].startswith('none') else "exists"))
+            print(f"{row['audit']:<26} {{{row['index']}}} {action:<8} {row['before']} -> {row['after']}")
+    if any(row['before'] == 'COLLSCAN' for rows in reports.values() for row in rows if row['audit'] in AUDIT_PIPELINE_SHAPES):
+        print("\nThe default pipeline engine always scans the collection; run price testing with "
+              "engine='materialize' to use the extendedValue index.")
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check audit query plans and create the indexes they need")
+    parser.add_argument("collections", nargs="*", help="collections to check (default: all inventory collections)")
+    parser.add_argument("--dry-run", action="store_true", help="only report plans and missing indexes")
+    args = parser.parse_args()
+    provision_indexes(backend.connect_to_mongodb(), args.collections, apply=not args.dry_run)